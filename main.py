@@ -1,8 +1,8 @@
 import logging
-import collections
 import os.path
 import datetime
 import clang.cindex
+from concurrent.futures import ProcessPoolExecutor
 
 
 class SourceCode:
@@ -11,6 +11,7 @@ class SourceCode:
 
     def __init__(self):
         self.file_code = dict()
+        self.real_paths = dict()
         self.encoding = 'utf-8'
         return
 
@@ -21,15 +22,18 @@ class SourceCode:
         :param encoding:
         :return:
         """
-        if not (file_path in self.file_code):
-            reader = open(file_path, 'rb')
-            content = reader.read()
+        if not (file_path in self.real_paths):
+            self.real_paths[file_path] = os.path.realpath(file_path)  # share code of symlinks
+        real_path = self.real_paths[file_path]
+        if not (real_path in self.file_code):
+            with open(real_path, 'rb') as reader:
+                content = reader.read()
             try:
                 code = content.decode(encoding)
             except UnicodeDecodeError:
-                code = content.decode(self.encoding)  # use default encoding
-            self.file_code[file_path] = code
-        return self.file_code[file_path]
+                code = content.decode(encoding, errors='replace')  # keep the others in one pass
+            self.file_code[real_path] = code
+        return self.file_code[real_path]
 
     def code_in(self, code_range: clang.cindex.SourceRange):
         if code_range is None:
@@ -42,25 +46,25 @@ class SourceCode:
         return code[beg_pos.offset: end_pos.offset]
 
 
+CPP_SUFFIXES = ('.c', '.cpp', '.h', '.hpp')  # the suffixes of C++ source files
+
+
 def cpp_files_in(dir_path: str):
-    """cpp_files_in returns the set of cpp, hpp, c and h files under the directory of input path
+    """cpp_files_in yields the cpp, hpp, c and h files under the directory of input path as soon as
+    they are found, so that the files can be parsed before the whole project is scanned.
 
     :param dir_path: the path of root directory of C++ project under analysis
-    :return: the set of paths of c, cpp, h, hpp files collected in the project
+    :return: the generator of paths of c, cpp, h, hpp files collected in the project
     """
-    queue = collections.deque()
-    queue.append(dir_path)
-    code_files = set()
-    while len(queue) > 0:
-        file_path = queue.popleft()
-        file_path: str
-        if os.path.isdir(file_path):
-            for child_name in os.listdir(file_path):
-                queue.append(os.path.join(file_path, child_name))
-        elif file_path.endswith('.c') or file_path.endswith('.cpp') or \
-                file_path.endswith('.h') or file_path.endswith('.hpp'):
-            code_files.add(file_path)
-    return code_files
+    if os.path.isfile(dir_path):
+        if dir_path.endswith(CPP_SUFFIXES):
+            yield dir_path
+        return
+    for parent_dir, _, file_names in os.walk(dir_path, followlinks=False):
+        for file_name in file_names:
+            if file_name.endswith(CPP_SUFFIXES):
+                yield os.path.join(parent_dir, file_name)
+    return
 
 
 def parse(c_index: clang.cindex.Index, code_file: str):
@@ -71,21 +75,46 @@ def parse(c_index: clang.cindex.Index, code_file: str):
         return None
 
 
+__clang_index__ = None  # the libclang index owned by each parsing worker process
+
+
+def __init_worker__(lib_path: str):
+    """__init_worker__ sets the libclang library path and creates the index of a parsing worker
+
+    :param lib_path: the path of directory of the libclang library files
+    :return:
+    """
+    global __clang_index__
+    if not clang.cindex.Config.loaded:
+        clang.cindex.Config.set_library_path(lib_path)
+    __clang_index__ = clang.cindex.Index.create()  # Index cannot be shared among processes
+    return
+
+
+def __parse_in_worker__(code_file: str):
+    """__parse_in_worker__ parses the code file with the index of current worker process
+
+    :param code_file: the path of C++ source file to be parsed
+    :return: the path of code file and True iff. it is parsed successfully
+    """
+    return code_file, parse(__clang_index__, code_file) is not None
+
+
 if __name__ == '__main__':
     print('Hello, cpplinter.')
-    clang.cindex.Config.set_library_path('/opt/homebrew/opt/llvm/lib')  # set the libclang library path
-    clang_index = clang.cindex.Index.create()
+    lib_path = '/opt/homebrew/opt/llvm/lib'  # the libclang library path
     repos_dir = '/Users/linhuan/Development/CcRepos'
 
     pass_numb, fail_numb = 0, 0
     beg_time = datetime.datetime.now()
-    for code_file_path in cpp_files_in(repos_dir):
-        unit = parse(clang_index, code_file_path)
-        if unit is None:
-            fail_numb += 1
-        else:
-            pass_numb += 1
-            print('\tpass: {}'.format(code_file_path))
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=__init_worker__,
+                             initargs=(lib_path,)) as pool:
+        for code_file_path, passed in pool.map(__parse_in_worker__, cpp_files_in(repos_dir), chunksize=4):
+            if passed:
+                pass_numb += 1
+                print('\tpass: {}'.format(code_file_path))
+            else:
+                fail_numb += 1
     end_time = datetime.datetime.now()
     duration = end_time - beg_time
     pass_rate = 0.0
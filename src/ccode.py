@@ -3,24 +3,85 @@
 author: Lin Huan
 Date:   2023/03/23
 """
+import array
+import bisect
+import codecs
 import collections
+import ctypes
+import gc
+import hashlib
+import itertools
 import json
+import mmap
 import os
+import stat
 
 import chardet
-import random
 import logging
 import clang.cindex
+from concurrent.futures import ProcessPoolExecutor
+
+SOURCE_SUFFIXES = ('.c', '.cpp', '.h', '.hpp', '.cc', '.cxx')  # the suffixes of C++ source files
+__KIND_NAMES__ = dict()  # map from kinds of cursor and type to their names
+__WS_TABLE__ = str.maketrans('\n\t\r', '   ')  # the table to replace line breaks and tabs in snippets
+__QUOTED_NAMES__ = dict()  # map from names of cursor and type kinds to JSON strings
+# the options of libclang to parse source files without function bodies, for declarations only
+SKIP_BODY_OPTIONS = clang.cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES | \
+                    clang.cindex.TranslationUnit.PARSE_INCOMPLETE
+
+
+def kind_name(kind):
+    """
+    :param kind: the CursorKind or TypeKind of libclang, of which set is finite
+    :return:     the name of kind as `str(kind)`, which is only computed once
+    """
+    name = __KIND_NAMES__.get(kind)
+    if name is None:
+        name = str(kind)
+        __KIND_NAMES__[kind] = name
+    return name
+
+
+def code_snippet(code_data: bytes, beg_offset: int, end_offset: int):
+    """
+    :param code_data:  the code of source file in cache encoded in UTF-8 as it is passed to libclang
+                       in parsing, of which offsets in source locations count the bytes rather
+                       than characters
+    :param beg_offset: the offset of the first byte of the snippet
+    :param end_offset: the offset of the byte after the snippet
+    :return:           the first 32 characters of the snippet (with '...' if it is longer), where
+                       line breaks and tabs are replaced with spaces
+    """
+    # a character takes at most 4 bytes, so only the head of snippet is decoded
+    length = end_offset - beg_offset
+    snippet = code_data[beg_offset: beg_offset + min(length, 128)].decode('utf-8', errors='replace')
+    if (len(snippet) > 32) or (length > 128):
+        snippet = snippet[0: 32] + '...'
+    return snippet.translate(__WS_TABLE__)
+
+
+def __quoted_name__(name: str):
+    """
+    :param name: the name of kind of cursor or type, of which the set is finite
+    :return:     the JSON string of the name that is escaped only once
+    """
+    quoted = __QUOTED_NAMES__.get(name)
+    if quoted is None:
+        quoted = json.encoder.encode_basestring_ascii(name)
+        __QUOTED_NAMES__[name] = quoted
+    return quoted
 
 
 def set_clang_libpath(lib_path: str):
     """This method is used to reset the library path of libclang to avoid
-    compile error in static analysis.
+    compile error in static analysis. It takes no effect once the library
+    has been loaded, e.g., in the worker processes forked by the parent.
 
     :param lib_path: the path of directory of the libclang library files
     :return:
     """
-    clang.cindex.Config.set_library_path(lib_path)
+    if not clang.cindex.Config.loaded:
+        clang.cindex.Config.set_library_path(lib_path)
     return
 
 
@@ -32,59 +93,119 @@ class CFileReader:
     To use CFileReader, simply invoke `code_segment(file_path, offset, length)`.
     """
 
-    def __init__(self):
-        self.__files__ = dict()  # map from path of source files to its code
+    def __init__(self, skip_bodies: bool = False, ast_dir: str = None):
+        """
+        :param skip_bodies: True to parse the files without function bodies, which is
+                            much faster when only the declarations are analyzed
+        :param ast_dir:     the directory where the parsed ASTs are saved and reused in
+                            the later runs, or None to not save them
+        """
+        self.__files__ = collections.OrderedDict()  # LRU map from path of source files to code
+        self.__file_stats__ = dict()  # map from path of files in cache to their (size, mtime) when loaded
+        self.__encodings__ = dict()  # map from path of source files to (size, mtime, encoding)
+        self.__real_paths__ = dict()  # map from path of source files to real path
+        self.__line_starts__ = dict()  # map from real path to offsets where its lines start
         self.__cache_cap__ = 16  # the capability of the cache to load files
-        self.__suffix__ = ['.c', '.cpp', '.h', '.hpp']  # suffix of source file
+        self.__cache_size__ = 0  # the number of characters of code in cache
+        self.__max_size__ = 64 * 1024 * 1024  # the budget of characters in cache
+        self.__mmap_min__ = 16 * 1024  # the size of files from which they are mapped, not read
         self.__parser__ = clang.cindex.Index.create()  # used to parse AST file
+        self.__options__ = 0  # the options of libclang to parse AST file
+        if skip_bodies:
+            self.__options__ = SKIP_BODY_OPTIONS
+        self.__units__ = collections.OrderedDict()  # LRU map from (path, mtime, options) to its AST
+        self.__unit_cap__ = 4  # the capability of the cache of ASTs, which are large
+        self.__ast_dir__ = ast_dir
         return
 
-    def __randomly_clean__(self):
-        """This method randomly clean a file with its code from cache to limit the memory used.
+    def __clean_cache__(self):
+        """This method cleans the least recently used files with their code from cache to limit the memory
+        used, until both the number of files and the size of their code are in the limits. The most recent
+        file is always kept even if it is larger than the budget.
 
-        :return: the path of file of which code will be removed or empty if no file is cleaned
+        :return: the paths of files of which code are removed or empty if no file is cleaned
         """
         cleaned_files = list()
-        while len(self.__files__) > self.__cache_cap__:
-            # randomly select a file to be cleaned from cache
-            index = random.randint(0, len(self.__files__)-1)
-            removed_file = ''
-            for file_path, _ in self.__files__.items():
-                index -= 1
-                removed_file = file_path
-                if index < 0:
-                    break
-            self.__files__.pop(removed_file)  # remove the file
+        while (len(self.__files__) > self.__cache_cap__) or \
+                (len(self.__files__) > 1 and self.__cache_size__ > self.__max_size__):
+            removed_file, removed_code = self.__files__.popitem(last=False)  # remove the LRU file
+            self.__cache_size__ -= len(removed_code)
+            self.__file_stats__.pop(removed_file, None)
+            self.__line_starts__.pop(removed_file, None)
             cleaned_files.append(removed_file)
         return cleaned_files
 
     def __load_from_file__(self, file_path: str):
-        """This method simply loads the code of file in given path to cache
+        """This method simply loads the code of file in given path to cache, where the code in cache
+        is loaded again if the size or modification time of the file has changed since it was loaded.
 
         :param file_path: the path of source file, of which code is loaded
         :return: True iff. the loading succeeds or False otherwise.
         """
-        if file_path in self.__files__:
-            return True  # the code has been loaded in its cache
-        elif not os.path.exists(file_path):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
             return False  # cannot read because it does not exist
-        elif os.path.isdir(file_path):
+        if stat.S_ISDIR(file_stat.st_mode):
             return False  # cannot read because it is not text file
+        file_key = (file_stat.st_size, file_stat.st_mtime_ns)
+        if file_path in self.__files__:
+            if self.__file_stats__.get(file_path) == file_key:
+                self.__files__.move_to_end(file_path)  # mark it as the most recently used
+                return True  # the code in its cache is as new as the file
+            self.__cache_size__ -= len(self.__files__.pop(file_path))  # the file has been modified
+            self.__line_starts__.pop(file_path, None)
+
+        # read the file only once and decode its bytes in safe way, where the large files are
+        # mapped and decoded from the page cache directly without a copy of their bytes
+        with open(file_path, mode='rb') as reader:
+            if file_stat.st_size >= self.__mmap_min__:
+                with mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) as raw_data:
+                    code_text = self.__decode__(file_path, file_stat, raw_data)
+            else:
+                code_text = self.__decode__(file_path, file_stat, reader.read())
 
-        # fetch the encoding of target file for loading
-        raw_data = open(file_path, 'rb').read()
-        file_status = chardet.detect(raw_data)
-        encoding = 'utf-8'  # default: UTF-8
-        if ('encoding' in file_status) and file_status['encoding']:
-            encoding = file_status['encoding']
+        self.__files__[file_path] = code_text
+        self.__file_stats__[file_path] = file_key
+        self.__cache_size__ += len(code_text)
+        self.__clean_cache__()  # clean the LRU ones if out of cache
+        return True
 
-        self.__randomly_clean__()  # randomly clean one if out of cache
+    def __decode__(self, file_path: str, file_stat: os.stat_result, raw_data):
+        """This method decodes the bytes of source file, of which encoding is detected
+        from its BOM, or by UTF-8, or by chardet on its head in order, where bytes that
+        cannot be decoded by the detected encoding are replaced.
 
-        # read the file with given encoding in safe way
-        with open(file_path, mode='r', encoding=encoding) as reader:
-            code_text = reader.read()
-            self.__files__[file_path] = code_text
-        return True
+        :param file_path: the path of source file, of which bytes are decoded
+        :param file_stat: the status of source file to memorize its encoding
+        :param raw_data:  the bytes (or mapped memory) of the source file being decoded
+        :return:          the code text decoded from bytes of the source file
+        """
+        # only the encoding of the latest version of each file is kept
+        f_size, f_mtime, encoding = self.__encodings__.get(file_path, (None, None, None))
+        if (f_size == file_stat.st_size) and (f_mtime == file_stat.st_mtime_ns):
+            return str(raw_data, encoding, 'replace')
+
+        if raw_data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+            encoding = 'utf-8-sig'
+            try:
+                code_text = str(raw_data, encoding)
+            except UnicodeDecodeError:
+                code_text = str(raw_data, encoding, 'replace')  # keep the BOM-marked encoding
+        else:
+            try:
+                encoding = 'utf-8'  # default: UTF-8 (and ASCII)
+                code_text = str(raw_data, encoding)
+            except UnicodeDecodeError:
+                file_status = chardet.detect(raw_data[:65536])  # only detect the head
+                encoding = file_status.get('encoding') or 'latin-1'
+                try:
+                    code_text = str(raw_data, encoding, 'replace')
+                except LookupError:
+                    encoding = 'latin-1'  # unknown codec reported by chardet
+                    code_text = str(raw_data, encoding)
+        self.__encodings__[file_path] = (file_stat.st_size, file_stat.st_mtime_ns, encoding)
+        return code_text
 
     def __load_file__(self, file_path: str):
         """This method loads the code of given file and returns its code
@@ -92,15 +213,35 @@ class CFileReader:
         :param file_path: the path of source file, of which file is read
         :return: the code of the file or raise FileNotFoundError otherwise
         """
-        if not self.is_source_file(file_path):
-            raise TypeError('not C++ file: {}'.format(file_path))
-        self.__load_from_file__(file_path)
-        if file_path in self.__files__:
-            code = self.__files__[file_path]
+        real_path = self.__real_paths__.get(file_path)  # validated and normalized once
+        if real_path is None:
+            if not self.is_source_file_by_name(file_path):
+                raise TypeError('not C++ file: {}'.format(file_path))
+            real_path = os.path.realpath(file_path)
+            self.__real_paths__[file_path] = real_path
+        if self.__load_from_file__(real_path):
+            code = self.__files__[real_path]
             code: str
             return code
         raise FileNotFoundError(file_path)
 
+    def release_file(self, file_path: str):
+        """This method removes the code and AST of the source file from cache once it is no longer used.
+
+        :param file_path: the path of source file of which code is removed
+        :return: True iff. the code of the file was in the cache
+        """
+        for unit_key in [unit_key for unit_key in self.__units__ if unit_key[0] == file_path]:
+            self.__units__.pop(unit_key)
+        real_path = self.__real_paths__.get(file_path)
+        self.__line_starts__.pop(real_path, None)
+        self.__encodings__.pop(real_path, None)
+        if real_path in self.__files__:
+            self.__cache_size__ -= len(self.__files__.pop(real_path))
+            self.__file_stats__.pop(real_path, None)
+            return True
+        return False
+
     def code_of_file(self, file_path: str):
         """This method returns the code of the source file.
 
@@ -122,6 +263,26 @@ class CFileReader:
             return file_code[offset: offset+length]
         raise IndexError('({}, {}) is out of {}'.format(offset, offset+length, len(file_code)))
 
+    def code_line_of_offset(self, file_path: str, offset: int):
+        """This method finds the line of the character at offset in the code of given file, by the
+        table of offsets where lines start, which is built once when the file is first queried.
+
+        :param file_path: the path of source file of which line is found
+        :param offset:    the offset of the character in the code of the file
+        :return:          the line number that starts from 1
+        """
+        file_code = self.__load_file__(file_path)
+        real_path = self.__real_paths__[file_path]
+        line_starts = self.__line_starts__.get(real_path)
+        if line_starts is None:
+            line_starts = array.array('l', [0])
+            line_end = file_code.find('\n')
+            while line_end >= 0:
+                line_starts.append(line_end + 1)
+                line_end = file_code.find('\n', line_end + 1)
+            self.__line_starts__[real_path] = line_starts
+        return bisect.bisect_right(line_starts, offset)
+
     def is_source_file(self, file_path: str):
         """
         :param file_path:
@@ -131,113 +292,321 @@ class CFileReader:
             return False
         elif os.path.isdir(file_path):
             return False
-        for suffix in self.__suffix__:
-            if file_path.endswith(suffix):
-                return True
-        return False
+        return self.is_source_file_by_name(file_path)
+
+    def is_source_file_by_name(self, file_path: str):
+        """This method only checks the suffix of the path without accessing the
+        file system, used when the caller has known the path is an existing file.
+
+        :param file_path:
+        :return: True if the path of input file has the suffix of C++ source file.
+        """
+        return file_path.endswith(SOURCE_SUFFIXES)
 
     def source_files_in(self, root_path: str):
-        """This method finds the set of paths of source code files in the root directory.
+        """This method finds the paths of source code files in the root directory, which are
+        yielded as soon as they are found so that the callers can start before the scan ends.
 
         :param root_path: the path of root of the project's directory
-        :return: the set of paths of source files in root_path of C++
+        :return: the generator of paths of source files in root_path of C++
         """
-        queue = collections.deque()
-        queue.append(root_path)
-        source_files = set()
-        while len(queue) > 0:
-            file_path = queue.popleft()
-            file_path: str
-            if not os.path.exists(file_path):
-                continue
-            elif os.path.isdir(file_path):
-                for child_name in os.listdir(file_path):
-                    queue.append(os.path.join(file_path, child_name))
-            else:
-                for suffix in self.__suffix__:
-                    if file_path.endswith(suffix):
-                        source_files.add(file_path)
-                        break
-        return source_files
+        if os.path.isfile(root_path):
+            if self.is_source_file_by_name(root_path):
+                yield root_path
+            return
+        dir_stack = [root_path]  # the order of directories being visited is not cared
+        while len(dir_stack) > 0:
+            dir_path = dir_stack.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:  # the type of entry is cached from directory reading
+                        if entry.is_dir(follow_symlinks=False):
+                            dir_stack.append(entry.path)
+                        elif self.is_source_file_by_name(entry.name) and entry.is_file():
+                            yield entry.path
+            except OSError:
+                continue  # cannot read because it does not exist or is not permitted
+        return
+
+    def __parse_source__(self, file_path: str, options: int):
+        """The code of source file is loaded to the cache and handed to libclang as an unsaved
+        file, so that libclang does not read the same file from disk again, and the offsets in
+        the AST count the bytes of the decoded code in UTF-8 (without BOM) that the snippets
+        are sliced from, whatever the encoding of the file is.
+
+        :param file_path: the path of source file being parsed
+        :param options:   the options of libclang to parse the source file
+        :return: the translation unit parsed from the source file
+        """
+        return self.__parser__.parse(file_path, unsaved_files=self.__unsaved_files__(file_path),
+                                     options=options)
 
-    def parse_trans_unit(self, file_path: str):
+    def __unsaved_files__(self, file_path: str):
         """
         :param file_path: the path of source file being parsed
+        :return:          the list of the source file with its code in the cache, which is loaded
+                          if it is not in the cache or out of date, or None if it cannot be read
+        """
+        try:
+            return [(file_path, self.__load_file__(file_path))]
+        except (OSError, UnicodeDecodeError):
+            return None  # libclang reads the file by itself and reports it if missing
+
+    def __parse_with_ast_dir__(self, file_path: str, file_mtime: int, options: int):
+        """This method loads the AST saved in the AST directory if it is newer than the source
+        file, or otherwise parses the source file and saves its AST for the next run. Note that
+        only the source file itself is compared, not the headers included by it.
+
+        :param file_path:  the path of source file being parsed
+        :param file_mtime: the modification time of source file in nanoseconds
+        :param options:    the options of libclang to parse the source file
+        :return: the translation unit of source file
+        """
+        ast_key = '{}#{}'.format(os.path.realpath(file_path), options)
+        ast_name = hashlib.sha1(ast_key.encode('utf-8')).hexdigest() + '.ast'
+        ast_path = os.path.join(self.__ast_dir__, ast_name)
+        try:
+            if os.stat(ast_path).st_mtime_ns >= file_mtime:
+                return clang.cindex.TranslationUnit.from_ast_file(ast_path, self.__parser__)
+        except (OSError, clang.cindex.TranslationUnitLoadError):
+            pass  # parse the source file if the AST is not saved or broken
+        tran_unit = self.__parse_source__(file_path, options)
+        try:
+            os.makedirs(self.__ast_dir__, exist_ok=True)
+            tran_unit.save(ast_path)
+        except (OSError, clang.cindex.TranslationUnitSaveError) as e:
+            logging.warning('cannot save AST of {}: {}'.format(file_path, e))
+        return tran_unit
+
+    def __reparse_unit__(self, file_path: str, options: int):
+        """This method reparses the cached translation unit of the source file parsed before it was
+        modified, on the new code of the file that is loaded again to the cache.
+
+        :param file_path: the path of source file being parsed
+        :param options:   the options of libclang to parse the source file
+        :return: the translation unit reparsed, or None if the file has not been parsed before
+        """
+        old_key = None
+        for unit_key in self.__units__:
+            if (unit_key[0] == file_path) and (unit_key[2] == options):
+                old_key = unit_key
+                break
+        if old_key is None:
+            return None
+        tran_unit = self.__units__.pop(old_key)
+        tran_unit: clang.cindex.TranslationUnit
+        try:
+            tran_unit.reparse(unsaved_files=self.__unsaved_files__(file_path))
+            return tran_unit
+        except clang.cindex.TranslationUnitLoadError:
+            return None  # parse it from scratch
+
+    def parse_trans_unit(self, file_path: str, options: int = None):
+        """The translation units are cached by the path and modification time of source file,
+        so that the same file will not be parsed again until it is modified. A modified file is
+        reparsed incrementally on its cached translation unit, which reuses the Index state.
+
+        :param file_path: the path of source file being parsed
+        :param options:   the options of libclang to parse the file, e.g., SKIP_BODY_OPTIONS,
+                          or None to use the options of the reader
         :return: the Index of Clang AST traversal
         """
-        if self.is_source_file(file_path):
-            return self.__parser__.parse(file_path)
-        raise FileNotFoundError('{}'.format(file_path))
+        if not self.is_source_file_by_name(file_path):
+            raise FileNotFoundError('{}'.format(file_path))
+        if options is None:
+            options = self.__options__
+        try:
+            file_mtime = os.stat(file_path).st_mtime_ns
+        except OSError:
+            return self.__parse_source__(file_path, options)  # libclang reports the missing file
+        unit_key = (file_path, file_mtime, options)
+        if unit_key in self.__units__:
+            self.__units__.move_to_end(unit_key)
+            return self.__units__[unit_key]
+
+        tran_unit = self.__reparse_unit__(file_path, options)
+        if tran_unit is None:
+            if self.__ast_dir__ is None:
+                tran_unit = self.__parse_source__(file_path, options)
+            else:
+                tran_unit = self.__parse_with_ast_dir__(file_path, file_mtime, options)
+        self.__units__[unit_key] = tran_unit
+        while len(self.__units__) > self.__unit_cap__:
+            self.__units__.popitem(last=False)
+        return tran_unit
 
-    def __dump_ast_json__(self, file_path: str,
-                          tran_unit: clang.cindex.TranslationUnit,
-                          parent: clang.cindex.Cursor):
-        """This method dumps the AST node of source file to JSON-format.
+    def __node_info__(self, file_path: str, code: bytes, parent: clang.cindex.Cursor):
+        """This method fetches the information of a single AST node shown in JSON-format.
 
         :param file_path: the path of C++ file to be parsed as JSON
-        :param tran_unit: the translation unit of AST of code files
-        :param parent:    the AST node to be parsed recursively
-        :return:          the dict of JSON-format object of parent
+        :param code:      the code of C++ file in UTF-8 bytes or None if it cannot be read
+        :param parent:    the AST node to be parsed as JSON, which is in the file
+        :return:          the kind, line, column, code (or None) and type (or None) of parent
         """
-        # print the node kind if any
-        if (parent is None) or (tran_unit is None):
-            return None
-        beg_pos = parent.extent.start
-        end_pos = parent.extent.end
+        extent = parent.extent
+        beg_pos = extent.start
         beg_pos: clang.cindex.SourceLocation
-        end_pos: clang.cindex.SourceLocation
-        if (beg_pos.file is None) or (beg_pos.file.name != file_path):
-            return None
 
-        # print the location range info
-        parent_json = dict()
-        parent_json['kind'] = str(parent.kind)
-        if beg_pos.file is not None:
-            parent_json['range'] = {
-                'file': beg_pos.file.name,
-                'line': beg_pos.line,
-                'cols': beg_pos.column,
-            }
-            if beg_pos.file.name == file_path:
-                try:
-                    code = self.code_of_file(file_path)
-                    sub_code = code[beg_pos.offset: end_pos.offset]
-                    if len(sub_code) > 32:
-                        sub_code = sub_code[0: 32] + '...'
-                    sub_code = sub_code.replace('\n', ' ')
-                    sub_code = sub_code.replace('\t', ' ')
-                    parent_json['range']['code'] = sub_code
-                except FileNotFoundError:
-                    pass
-
-        # print type information if any
-        if parent.type is not None:
-            node_type = parent.type
+        # fetch the code segment of the node if any
+        sub_code = None
+        if code is not None:
+            end_pos = extent.end
+            end_pos: clang.cindex.SourceLocation
+            sub_code = code_snippet(code, beg_pos.offset, end_pos.offset)
+
+        # fetch type information if any
+        type_str = None
+        node_type = parent.type
+        if node_type is not None:
             node_type: clang.cindex.Type
-            type_str = str(node_type.kind)
-            if type_str != 'TypeKind.INVALID':
-                parent_json['type'] = str(node_type.kind)
+            type_str = kind_name(node_type.kind)
+            if type_str == 'TypeKind.INVALID':
+                type_str = None
+        return kind_name(parent.kind), beg_pos.line, beg_pos.column, sub_code, type_str
 
-        # recursively traverse the AST
-        child_numb, children = 0, list()
+    @staticmethod
+    def __children_in__(file_path: str, parent: clang.cindex.Cursor, file_matches: dict):
+        """
+        :param file_path:    the path of C++ file being parsed
+        :param parent:       the AST node of which children are fetched
+        :param file_matches: map from address of libclang file to whether it is the file,
+                             which avoids fetching the name of same file for each child
+        :return:             the list of children of parent located in the file
+        """
+        children = list()
         for child in parent.get_children():
-            child_json = self.__dump_ast_json__(file_path, tran_unit, child)
-            if child_json is not None:
-                children.append(child_json)
-        if len(children) > 0:
-            parent_json['children'] = children
-        elif child_numb > 0:
-            parent_json['children'] = child_numb
-        return parent_json
-
-    def dump_ast_to_json(self, file_path: str):
+            # skip the subtree not in the file before any work on it
+            child_file = child.location.file
+            if child_file is None:
+                continue
+            file_addr = ctypes.addressof(child_file.obj.contents)
+            matched = file_matches.get(file_addr)
+            if matched is None:
+                matched = child_file.name == file_path
+                file_matches[file_addr] = matched
+            if matched:
+                children.append(child)
+        return children
+
+    @staticmethod
+    def __root_in__(file_path: str, root: clang.cindex.Cursor):
+        """
+        :param file_path: the path of C++ file being parsed
+        :param root:      the root of AST of the file
+        :return:          True iff. the root is located in the file
+        """
+        if root is None:
+            return False
+        root_file = root.extent.start.file  # the root cursor has no location file
+        return (root_file is not None) and (root_file.name == file_path)
+
+    def __dump_ast_json__(self, file_path: str, code: bytes, root: clang.cindex.Cursor):
+        """This method dumps the AST of source file to JSON-format by an iterative pre-order walk
+        on an explicit stack, which avoids the frame cost and recursion limit of deep ASTs.
+
+        :param file_path: the path of C++ file to be parsed as JSON
+        :param code:      the code of C++ file in UTF-8 bytes or None if it cannot be read
+        :param root:      the root of AST to be parsed
+        :return:          the dict of JSON-format object of root
+        """
+        if not self.__root_in__(file_path, root):
+            return None
+        root_json, file_matches = None, dict()
+        stack = [(root, None)]  # pairs of AST node and the JSON of its parent
+        while len(stack) > 0:
+            parent, parent_json = stack.pop()
+            kind, line, cols, sub_code, type_str = self.__node_info__(file_path, code, parent)
+            node_json = {'kind': kind, 'range': {'file': file_path, 'line': line, 'cols': cols}}
+            if sub_code is not None:
+                node_json['range']['code'] = sub_code
+            if type_str is not None:
+                node_json['type'] = type_str
+            if parent_json is None:
+                root_json = node_json
+            else:
+                parent_json.setdefault('children', list()).append(node_json)
+            for child in reversed(self.__children_in__(file_path, parent, file_matches)):
+                stack.append((child, node_json))
+        return root_json
+
+    def __emit_ast_json__(self, writer, file_path: str, code: bytes, root: clang.cindex.Cursor):
+        """This method writes the AST of source file as JSON text in the walk over it, without
+        building the dict of the whole AST in memory.
+
+        :param writer:    the text stream where the JSON text is written
+        :param file_path: the path of C++ file to be parsed as JSON
+        :param code:      the code of C++ file in UTF-8 bytes or None if it cannot be read
+        :param root:      the root of AST to be parsed
+        :return:
+        """
+        if not self.__root_in__(file_path, root):
+            writer.write('null')
+            return
+        quote, file_matches = json.encoder.encode_basestring_ascii, dict()
+        file_text = ',"range":{"file":' + quote(file_path) + ',"line":'  # same for all the nodes
+        stack = [(root, '')]  # pairs of AST node (or None) and the text written before it
+        while len(stack) > 0:
+            parent, prefix = stack.pop()
+            if parent is None:
+                writer.write(prefix)
+                continue  # the prefix closes the children of a node
+
+            # join the fields of node schema into a single write
+            kind, line, cols, sub_code, type_str = self.__node_info__(file_path, code, parent)
+            node_text = prefix + '{"kind":' + __quoted_name__(kind) + \
+                file_text + str(line) + ',"cols":' + str(cols)
+            if sub_code is not None:
+                node_text += ',"code":' + quote(sub_code)
+            node_text += '}'
+            if type_str is not None:
+                node_text += ',"type":' + __quoted_name__(type_str)
+
+            children = self.__children_in__(file_path, parent, file_matches)
+            if len(children) > 0:
+                writer.write(node_text + ',"children":[')
+                stack.append((None, ']}'))
+                for index in range(len(children) - 1, -1, -1):
+                    stack.append((children[index], ',' if index > 0 else ''))
+            else:
+                writer.write(node_text + '}')
+        return
+
+    def __parse_with_code__(self, file_path: str, tran_unit: clang.cindex.TranslationUnit):
+        """
+        :param file_path: the path of C++ source file to be parsed
+        :param tran_unit: the translation unit of source file, parsed if it is None
+        :return:          the translation unit and the code of file in UTF-8 bytes as libclang reads
+                          it (None if it cannot be read)
+        """
+        try:
+            code = self.code_of_file(file_path).encode('utf-8')  # fetch the code once for all the nodes
+        except FileNotFoundError:
+            code = None
+        if tran_unit is None:
+            tran_unit = self.parse_trans_unit(file_path)  # parse on the code being loaded
+        return tran_unit, code
+
+    def dump_ast_to_json(self, file_path: str, tran_unit: clang.cindex.TranslationUnit = None):
         """This method dumps the AST of source file into JSON format.
 
         :param file_path: the path of C++ source file to be parsed
+        :param tran_unit: the translation unit of source file, parsed if it is None
         :return:          the dict of JSON-format object be parsed
         """
-        t_unit = self.parse_trans_unit(file_path)
-        return self.__dump_ast_json__(file_path, t_unit, t_unit.cursor)
+        tran_unit, code = self.__parse_with_code__(file_path, tran_unit)
+        return self.__dump_ast_json__(file_path, code, tran_unit.cursor)
+
+    def emit_ast_json(self, file_path: str, writer, tran_unit: clang.cindex.TranslationUnit = None):
+        """This method writes the AST of source file as JSON text to the writer in streaming.
+
+        :param file_path: the path of C++ source file to be parsed
+        :param writer:    the text stream where the JSON text is written
+        :param tran_unit: the translation unit of source file, parsed if it is None
+        :return:
+        """
+        tran_unit, code = self.__parse_with_code__(file_path, tran_unit)
+        self.__emit_ast_json__(writer, file_path, code, tran_unit.cursor)
+        return
 
 
 def __percent__(x: int, y: int):
@@ -261,42 +630,77 @@ def do_visit_ast(reader: CFileReader, src_file: str, out_file: str,
     :param translation_unit: AST translation unit of C++ file
     :return: None
     """
-    with open(out_file, 'w') as writer:
-        text = json.dumps(reader.dump_ast_to_json(src_file))
-        # text = json.dumps(__ast2json__(reader, src_file, translation_unit.cursor))
-        writer.write(text)
-        writer.close()
+    with open(out_file, 'w', buffering=256 * 1024) as writer:  # many small writes are batched
+        reader.emit_ast_json(src_file, writer, translation_unit)
     return
 
 
+__worker_reader__ = None  # the reader owned by each worker process dumping AST
+__worker_count__ = 0  # the number of files dumped by the worker process
+
+
+def __init_worker__(lib_path: str):
+    """This method initializes the worker process with its own libclang index.
+
+    :param lib_path: the path of directory of the libclang library files
+    :return:
+    """
+    global __worker_reader__
+    set_clang_libpath(lib_path)
+    __worker_reader__ = CFileReader()  # Index cannot be shared among processes
+    return
+
+
+def __dump_ast_in_worker__(src_file: str, out_dir: str):
+    """This method parses the source file and dumps its AST under the output directory.
+
+    :param src_file: the path of source code file be analyzed
+    :param out_dir:  the directory where `<basename>.json` is written
+    :return:         True iff. the AST of source file is dumped successfully
+    """
+    global __worker_count__
+    try:
+        # the code is loaded once and shared with libclang for parsing
+        __worker_reader__.code_of_file(src_file)
+        unit = __worker_reader__.parse_trans_unit(src_file)
+        o_file = os.path.join(out_dir, os.path.basename(src_file) + '.json')
+        do_visit_ast(__worker_reader__, src_file, o_file, unit)
+        return True
+    except FileNotFoundError:
+        logging.error('\tnot-found: {}'.format(src_file))
+    except UnicodeDecodeError as e:
+        logging.error('\tdecode-err: {}'.format(e))
+    except clang.cindex.TranslationUnitLoadError:
+        logging.error('\tcannot compile: {}'.format(src_file))
+    finally:
+        # release the AST and code of the file soon to keep memory flat
+        unit = None
+        __worker_reader__.release_file(src_file)
+        __worker_count__ += 1
+        if __worker_count__ % 16 == 0:
+            gc.collect()
+    return False
+
+
 if __name__ == '__main__':
     # set the libclang library path
-    set_clang_libpath('/opt/homebrew/opt/llvm/lib')
+    lib_dir = '/opt/homebrew/opt/llvm/lib'
+    set_clang_libpath(lib_dir)
     pass_numb, fail_numb = 0, 0
     file_reader = CFileReader()
     root_dir = '/Users/linhuan/Development/MyRepos/cpplinter/examples'
     out_dir = '/Users/linhuan/Development/MyRepos/cpplinter/output'
 
-    # traverse source file and parse
-    for c_file in file_reader.source_files_in(root_dir):
-        try:
-            # file_reader.code_of_file(c_file)
-            # file_reader.parse_trans_unit(c_file)
-            unit = file_reader.parse_trans_unit(c_file)
-            o_file = os.path.join(out_dir, os.path.basename(c_file) + '.json')
-            do_visit_ast(file_reader, c_file, o_file, unit)
-            pass_numb += 1
-        except FileNotFoundError:
-            logging.error('\tnot-found: {}'.format(c_file))
-            fail_numb += 1
-        except UnicodeDecodeError as e:
-            logging.error('\tdecode-err: {}'.format(e))
-            fail_numb += 1
-        except clang.cindex.TranslationUnitLoadError:
-            logging.error('\tcannot compile: {}'.format(c_file))
-            fail_numb += 1
+    # traverse source file and parse them in parallel
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=__init_worker__,
+                             initargs=(lib_dir,)) as pool:
+        for passed in pool.map(__dump_ast_in_worker__, file_reader.source_files_in(root_dir),
+                               itertools.repeat(out_dir), chunksize=4):
+            if passed:
+                pass_numb += 1
+            else:
+                fail_numb += 1
 
     # print the summary and exit it
     print('\nSummary: {} pass, {} fail ({}%).'.
           format(pass_numb, fail_numb, __percent__(pass_numb, fail_numb)))
-
@@ -3,26 +3,145 @@
 author: Lin Huan
 Date:   2023/03/23
 """
+import bisect
 import json
+import logging
 import os
-import collections
+import re
+import ctypes
 import clang.cindex
 import ccode
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson  # the faster JSON encoder writing bytes directly
+except ImportError:
+    orjson = None
+
+# the cursor kinds compared by linters, which are compared as enumerations instead of strings
+__FUNC_KINDS__ = frozenset((clang.cindex.CursorKind.CXX_METHOD, clang.cindex.CursorKind.FUNCTION_DECL,
+                            clang.cindex.CursorKind.CONSTRUCTOR, clang.cindex.CursorKind.FUNCTION_TEMPLATE))
+__PARM_DECL__ = clang.cindex.CursorKind.PARM_DECL
+__COMPOUND_STMT__ = clang.cindex.CursorKind.COMPOUND_STMT
+__INTEGER_LITERAL__ = clang.cindex.CursorKind.INTEGER_LITERAL
+__FLOATING_LITERAL__ = clang.cindex.CursorKind.FLOATING_LITERAL
+__VAR_DECL__ = clang.cindex.CursorKind.VAR_DECL
+__LITERAL_KINDS__ = frozenset((__INTEGER_LITERAL__, __FLOATING_LITERAL__))
+# the kinds of cursors which never have children in libclang, of which children are not visited
+__LEAF_KINDS__ = frozenset((
+    clang.cindex.CursorKind.INTEGER_LITERAL, clang.cindex.CursorKind.FLOATING_LITERAL,
+    clang.cindex.CursorKind.STRING_LITERAL, clang.cindex.CursorKind.CHARACTER_LITERAL,
+    clang.cindex.CursorKind.CXX_BOOL_LITERAL_EXPR, clang.cindex.CursorKind.CXX_NULL_PTR_LITERAL_EXPR,
+    clang.cindex.CursorKind.TYPE_REF, clang.cindex.CursorKind.TEMPLATE_REF,
+    clang.cindex.CursorKind.NAMESPACE_REF, clang.cindex.CursorKind.MEMBER_REF,
+    clang.cindex.CursorKind.LABEL_REF, clang.cindex.CursorKind.OVERLOADED_DECL_REF,
+    clang.cindex.CursorKind.VARIABLE_REF,
+))
+__INCLUDE_LINE__ = re.compile(r'^[ \t]*#[ \t]*(?:include|include_next|import)\b', re.MULTILINE)
+
+
+class NodeCtx:
+    """NodeCtx keeps the kind and source range of AST node, which are fetched from libclang
+    only once for all the linters checking the node.
+    """
+    __slots__ = ('cursor', 'kind', 'start_line', 'start_col', 'end_line', 'start_off', 'end_off',
+                 'fname', 'children')
+
+    def __init__(self, cursor: clang.cindex.Cursor, fname: str = None, children: list = None):
+        """
+        :param cursor:   the AST node of which context is created
+        :param fname:    the name of file where node starts, fetched from cursor if it is None
+        :param children: the list of children of node, fetched from cursor if it is None
+        """
+        beg_pos = cursor.extent.start
+        end_pos = cursor.extent.end
+        beg_pos: clang.cindex.SourceLocation
+        end_pos: clang.cindex.SourceLocation
+        if (fname is None) and (beg_pos.file is not None):
+            fname = beg_pos.file.name
+        self.cursor = cursor
+        self.kind = cursor.kind
+        self.start_line = beg_pos.line
+        self.start_col = beg_pos.column
+        self.end_line = end_pos.line
+        self.start_off = beg_pos.offset
+        self.end_off = end_pos.offset
+        self.fname = fname
+        self.children = children
+        return
+
+    def get_children(self):
+        """
+        :return: the list of children of the node, which is fetched only once
+        """
+        if self.children is None:
+            self.children = list(self.cursor.get_children())
+        return self.children
+
+
+class Report:
+    """Report is the record of an error found by linters, which is shaped as JSON only when it is written.
+    """
+    __slots__ = ('rule_id', 'rule_name', 'rule_text', 'ast_kind', 'file', 'line', 'column', 'err_code')
+
+    def __init__(self, rule_id: str, rule_name: str, rule_text: str, ast_kind: str):
+        self.rule_id = rule_id
+        self.rule_name = rule_name
+        self.rule_text = rule_text
+        self.ast_kind = ast_kind
+        self.file = None
+        self.line = None
+        self.column = None
+        self.err_code = None
+        return
+
+    def to_dict(self):
+        """
+        :return: the JSON object of the report, where the position is omitted if it is not in a file
+        """
+        report = {
+            'rule_id': self.rule_id,
+            'rule_name': self.rule_name,
+            'rule_text': self.rule_text,
+            'ast_kind': self.ast_kind,
+        }
+        if self.file is not None:
+            report['file'] = self.file
+            report['line'] = self.line
+            report['column'] = self.column
+            if self.err_code is not None:
+                report['err_code'] = self.err_code
+        return report
 
 
 class AstVisitor:
     """AstVisitor implements a simple stack-based visitor over abstract syntax tree of C++ source files.
     """
+    __slots__ = ('__reader__', '__f_path__', '__f_addr__', '__f_code__', '__f_data__', '__t_unit__',
+                 '__c_stack__', '__reports__', '__linters__', '__dispatch__', '__generic__')
 
     def __init__(self):
         self.__reader__ = ccode.CFileReader()
         self.__f_path__ = None
+        self.__f_addr__ = None
+        self.__f_code__ = None
+        self.__f_data__ = None
         self.__t_unit__ = None
         self.__c_stack__ = None
         self.__reports__ = None
         self.__linters__ = None
+        self.__dispatch__ = None
+        self.__generic__ = None
         return
 
+    @staticmethod
+    def __file_addr__(c_file: clang.cindex.File):
+        """
+        :param c_file: the libclang file object of source location, which is created anew on each access
+        :return: the address of underlying CXFile, which is unique for each file in a translation unit
+        """
+        return ctypes.addressof(c_file.obj.contents)
+
     def __reset__(self, file_path: str, linters: list):
         """This method resets the status of AstVisitor for analyzing source file.
 
@@ -31,281 +150,436 @@ class AstVisitor:
         :return: True if the compilation succeeds, or False otherwise
         """
         self.__f_path__ = None
+        self.__f_addr__ = None
+        self.__f_code__ = None
+        self.__f_data__ = None
         self.__t_unit__ = None
         self.__c_stack__ = None
         self.__reports__ = None
         self.__linters__ = None
+        self.__dispatch__ = None
+        self.__generic__ = None
+        valid_linters = list()
+        if linters:
+            for linter in linters:
+                if linter is None:
+                    continue
+                if isinstance(linter, BaseLinter):
+                    valid_linters.append(linter)
+        # the function bodies are skipped in parsing when none of the linters inspects them, where the
+        # extents of functions end before their bodies, and so do the code snippets of their reports
+        options = None
+        if (len(valid_linters) > 0) and not any(linter.INSPECTS_BODIES for linter in valid_linters):
+            options = ccode.SKIP_BODY_OPTIONS
+        # the code is loaded before the parse, so that libclang parses the code in the cache as it
+        # is shared by all reports, instead of reading the file from disk again
         try:
-            tran_unit = self.__reader__.parse_trans_unit(file_path)
+            f_code = self.__reader__.code_of_file(file_path)
+        except (UnicodeDecodeError, TypeError, OSError):
+            f_code = None  # the parser reports the file that cannot be read
+        try:
+            tran_unit = self.__reader__.parse_trans_unit(file_path, options)
             self.__f_path__ = file_path
+            try:
+                self.__f_addr__ = AstVisitor.__file_addr__(tran_unit.get_file(file_path))
+            except AssertionError:
+                self.__f_addr__ = None  # fall back to compare the names of files
+            self.__f_code__ = f_code
             self.__t_unit__ = tran_unit
-            self.__c_stack__ = collections.deque()
+            self.__c_stack__ = list()
             self.__reports__ = list()
-            self.__linters__ = list()
-            if linters:
-                for linter in linters:
-                    if linter is None:
-                        continue
-                    if isinstance(linter, BaseLinter):
-                        self.__linters__.append(linter)
+            self.__linters__ = valid_linters
+
+            # map from cursor kind to the linters of it, where the generic ones (of None kinds)
+            # check the nodes of every kind, including those not in the map, in the given order
+            linter_kinds = [(linter, linter.target_kinds()) for linter in self.__linters__]
+            dispatch = dict()
+            for _, kinds in linter_kinds:
+                for kind in (kinds or ()):
+                    if kind not in dispatch:
+                        dispatch[kind] = [linter for linter, l_kinds in linter_kinds
+                                          if (l_kinds is None) or (kind in l_kinds)]
+            self.__dispatch__ = dispatch
+            self.__generic__ = [linter for linter, kinds in linter_kinds if kinds is None]
             return True
         except clang.cindex.TranslationUnitLoadError:
             return False
 
-    def do_report(self, rule_id: str, rule_name: str, rule_text: str, trg_node: clang.cindex.Cursor):
+    def do_report(self, rule_id: str, rule_name: str, rule_text: str, trg_node: NodeCtx):
         """
         :param rule_id:
         :param rule_name:
         :param rule_text:
-        :param trg_node:
+        :param trg_node: the context of AST node where the error is reported
         :return: this method simply updates the reports set in the visitor context
         """
         if (trg_node is None) or (self.__reports__ is None):
             return
-        report = {
-            'rule_id': rule_id,
-            'rule_name': rule_name,
-            'rule_text': rule_text,
-            'ast_kind': str(trg_node.kind),
-        }
-
-        beg_pos = trg_node.extent.start
-        end_pos = trg_node.extent.end
-        beg_pos: clang.cindex.SourceLocation
-        end_pos: clang.cindex.SourceLocation
-        if beg_pos.file is not None:
-            report['file'] = beg_pos.file.name
-            report['line'] = beg_pos.line
-            report['column'] = beg_pos.column
+        report = Report(rule_id, rule_name, rule_text, ccode.kind_name(trg_node.kind))
+        if trg_node.fname is not None:
+            report.file = trg_node.fname
+            report.line = trg_node.start_line
+            report.column = trg_node.start_col
             try:
-                code = self.__reader__.code_of_file(beg_pos.file.name)
-                sub_code = code[beg_pos.offset: end_pos.offset]
-                if len(sub_code) > 32:
-                    sub_code = sub_code[0: 32] + '...'
-                sub_code = sub_code.replace('\n', ' ')
-                sub_code = sub_code.replace('\t', ' ')
-                sub_code = sub_code.replace('\r', ' ')
-                report['err_code'] = sub_code
+                # libclang parses the code in cache in UTF-8, of which offsets count bytes, not characters
+                if (self.__f_code__ is not None) and (trg_node.fname == self.__f_path__):
+                    if self.__f_data__ is None:
+                        self.__f_data__ = self.__f_code__.encode('utf-8')  # only once per file
+                    code_data = self.__f_data__
+                else:
+                    code_data = self.__reader__.code_of_file(trg_node.fname).encode('utf-8')
+                report.err_code = ccode.code_snippet(code_data, trg_node.start_off, trg_node.end_off)
             except UnicodeDecodeError:
                 pass
         self.__reports__.append(report)
         return
 
-    def __do_visit__(self, parent: clang.cindex.Cursor):
-        """This method implements the recursive access to AST of C++ source code files.
-
-        :param parent:
+    def __include_lines__(self):
+        """
+        :return: the sorted lines of the #include directives in the checked source file, of which
+                 cursors in a node that encloses none of them are all in the file, or None if the
+                 code of the file cannot be read
+        """
+        if self.__f_code__ is None:
+            return None
+        return [self.__reader__.code_line_of_offset(self.__f_path__, match.start())
+                for match in __INCLUDE_LINE__.finditer(self.__f_code__)]
+
+    def __do_visit__(self, root: clang.cindex.Cursor):
+        """This method implements the pre-order access to AST of C++ source code files on an explicit
+        stack, where None marks the exit from a node to pop it from the context stack of visitor, which
+        is only kept when one of the linters requires the parent stack.
+        The children of a node in the file inherit its status without checking their files in
+        libclang, unless an #include directive in the node may bring cursors of other files.
+
+        :param root:
         :return:
         """
         # to avoid AST traversal when status is undefined
-        if (self.__c_stack__ is None) or (parent is None):
+        if (self.__c_stack__ is None) or (root is None):
             return
 
-        # to avoid AST cursors not in the source file (included from others)
-        beg_pos = parent.extent.start
-        beg_pos: clang.cindex.SourceLocation
-        if (beg_pos.file is None) or (beg_pos.file.name != self.__f_path__):
-            return
+        # the attributes and methods used per node are bound to locals once for the whole walk
+        f_path, f_addr = self.__f_path__, self.__f_addr__
+        file_addr_of, linters_of, generic = AstVisitor.__file_addr__, self.__dispatch__.get, self.__generic__
+        ctx_push, ctx_pop = self.__c_stack__.append, self.__c_stack__.pop
+        needs_stack = any(linter.REQUIRES_PARENT_STACK for linter in self.__linters__)
+        include_lines, bisect_left = self.__include_lines__(), bisect.bisect_left
+        include_numb = 0 if include_lines is None else len(include_lines)
+        in_file_stack = [False]  # whether children of the context node are known to be in the file
+        in_file_push, in_file_pop = in_file_stack.append, in_file_stack.pop
+        work_stack = [root]
+        work_pop, work_push, work_extend = work_stack.pop, work_stack.append, work_stack.extend
+        while len(work_stack) > 0:
+            parent = work_pop()
+            if parent is None:
+                if needs_stack:
+                    ctx_pop()  # all the children of the node are visited
+                in_file_pop()
+                continue
 
-        # perform the AST-based C++ source code linter
-        if self.__linters__:
-            for linter in self.__linters__:
-                if linter is None:
+            # to prune the subtree of AST cursors not in the source file (included from others)
+            children_in_file = in_file_stack[-1]
+            if not children_in_file:
+                extent = parent.extent
+                beg_pos = extent.start
+                beg_pos: clang.cindex.SourceLocation
+                beg_file = beg_pos.file
+                if beg_file is None:
                     continue
-                linter: BaseLinter
-                linter.check(self, parent)
-
-        # recursively traverse the AST over the child nodes of the parent one
-        self.__c_stack__.append(parent)
-        for child in parent.get_children():
-            if child is None:
-                continue
-            self.__do_visit__(child)
-        self.__c_stack__.pop()
+                elif f_addr is not None:
+                    if file_addr_of(beg_file) != f_addr:
+                        continue
+                elif beg_file.name != f_path:
+                    continue
+                if include_lines is not None:
+                    index = bisect_left(include_lines, beg_pos.line)
+                    children_in_file = (index == include_numb) or \
+                                       (include_lines[index] > extent.end.line)
+
+            # perform the AST-based C++ source code linter on the kind of node
+            parent_kind = parent.kind
+            if parent_kind in __LEAF_KINDS__:
+                children = list()  # to avoid the visit of libclang for nodes without children
+            else:
+                children = list(parent.get_children())  # shared by the linters and the traversal
+            node_linters = linters_of(parent_kind, generic)
+            if node_linters:
+                node_ctx = NodeCtx(parent, f_path, children)  # the node is known to be in the file
+                for linter in node_linters:
+                    linter: BaseLinter
+                    linter.check(self, node_ctx)
+
+            # traverse the child nodes of the parent one in pre-order later, of which list is only
+            # iterated backwards by reversed() without being copied
+            if needs_stack:
+                ctx_push(parent)
+            in_file_push(children_in_file)
+            work_push(None)
+            work_extend(reversed(children))
         return
 
-    def do_file_check(self, file_path: str, linters: list, out_file: str):
+    def do_file_check(self, file_path: str, linters: list):
         """This method performs static check of linters on the given C++ source file.
 
-        :param file_path:
-        :param linters:
-        :param out_file:
-        :return:
+        :param file_path: the path of source file being checked for its errors
+        :param linters: the list of static code linters for checking errors in
+        :return: the list of Report found in the file, which are written by the caller in batch
         """
         if self.__reset__(file_path, linters):
             if self.__linters__ and self.__t_unit__:
                 self.__do_visit__(self.__t_unit__.cursor)
-                with open(out_file, 'w') as writer:
-                    writer.write(json.dumps(self.__reports__))
-                    writer.close()
+            return self.__reports__
         raise InterruptedError('cannot do check for file: {}'.format(file_path))
 
     def do_all_checks(self, root_path: str, linters: list, out_file: str):
-        """This method performs the linters for checking all the source files under root_dir.
+        """This method performs the linters for checking all the source files under root_dir,
+        of which reports are streamed into the output file as JSON lines (one report per line).
 
         :param root_path:
         :param linters:
         :param out_file:
         :return:
         """
-        reports = list()
-        for c_file in self.__reader__.source_files_in(root_path):
-            if self.__reset__(c_file, linters):
-                if self.__linters__ and self.__t_unit__:
-                    self.__do_visit__(self.__t_unit__.cursor)
-                    if self.__reports__:
-                        reports.extend(self.__reports__)
-                        print('\tFind {} errors in: {}'.format(len(self.__reports__), c_file))
-        with open(out_file, 'w') as writer:
-            writer.write(json.dumps(reports))
-            writer.close()
+        with open(out_file, 'wb', buffering=1 << 20) as writer, \
+                ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=__init_worker__,
+                                    initargs=(clang.cindex.Config.library_path, linters)) as pool:
+            for c_file, report_numb, report_data in pool.map(
+                    __lint_in_worker__, self.__reader__.source_files_in(root_path), chunksize=8):
+                if report_numb > 0:
+                    writer.write(report_data)
+                    print('\tFind {} errors in: {}'.format(report_numb, c_file))
         return
 
 
 class BaseLinter:
     """BaseLinter is the base class of linter for checking errors in C++ source file.
     """
+    __slots__ = ()
+    REQUIRES_PARENT_STACK = False  # True if the linter reads the ancestors of node in the visitor
+    INSPECTS_BODIES = True  # False if the linter only checks declarations, not function bodies
+
+    def target_kinds(self):
+        """
+        :return: the frozenset of cursor kinds of AST nodes checked by the linter, of which
+                 `check` is only invoked on the nodes of these kinds, or None for all kinds
+        """
+        return None
 
-    def check(self, visitor: AstVisitor, node: clang.cindex.Cursor):
+    def check(self, visitor: AstVisitor, ctx: NodeCtx):
+        """
+        :param visitor: the visitor of AST of which the node is being checked
+        :param ctx:     the context of AST node being checked by the linter
+        :return:
+        """
         raise NotImplementedError('Please use implemented linter.')
 
 
-class FuncBodySizeLinter(BaseLinter):
-    """FuncBodySizeLinter implements the linter for checking the size of function body.
+class FunctionDeclCompositeLinter(BaseLinter):
+    """FunctionDeclCompositeLinter implements the linter for checking both the size of function body and the
+    number of parameters, of which children of function are walked only once for both of the checks.
     """
+    __slots__ = ('__max_body_size__', '__max_param_num__')
 
-    def __init__(self, max_body_size: int):
+    def __init__(self, max_body_size: int, max_param_num: int):
         self.__max_body_size__ = max_body_size
+        self.__max_param_num__ = max_param_num
         return
 
-    def check(self, visitor: AstVisitor, node: clang.cindex.Cursor):
-        if (visitor is None) or (node is None):
+    @property
+    def INSPECTS_BODIES(self):
+        """
+        :return: False if only the number of parameters is checked, of which the reports show the code
+                 of the functions without their bodies, as these are skipped in parsing
+        """
+        return self.__max_body_size__ > 0
+
+    def target_kinds(self):
+        return __FUNC_KINDS__
+
+    def check(self, visitor: AstVisitor, ctx: NodeCtx):
+        if (visitor is None) or (ctx is None):
             return
-        func_kind = '{}'.format(node.kind)
-        if func_kind.endswith('CXX_METHOD') or func_kind.endswith('FUNCTION_DECL'):
-            for child in node.get_children():
-                if child is None:
-                    continue
-                child: clang.cindex.Cursor
-                child_kind = '{}'.format(child.kind)
-                if child_kind.endswith('COMPOUND_STMT'):
-                    beg_pos = child.extent.start
-                    end_pos = child.extent.end
-                    beg_pos: clang.cindex.SourceLocation
-                    end_pos: clang.cindex.SourceLocation
-                    length = end_pos.line - beg_pos.line
-                    if (self.__max_body_size__ > 0) and (length > self.__max_body_size__):
-                        visitor.do_report('CPP-000000', 'too_long_func_body',
-                                          'too long function body: {} lines'.format(length), child)
+        if ctx.kind in __FUNC_KINDS__:
+            param_numb, body_nodes = -1, list()
+            if self.__max_body_size__ <= 0:
+                # the number of parameters is read by libclang without walking the children, which
+                # is -1 for function templates of which parameters are counted in the children
+                param_numb = clang.cindex.conf.lib.clang_Cursor_getNumArguments(ctx.cursor)
+            if param_numb < 0:
+                param_numb = 0
+                for child in ctx.get_children():
+                    if child is None:
+                        continue
+                    child: clang.cindex.Cursor
+                    child_kind = child.kind
+                    if child_kind == __PARM_DECL__:
+                        param_numb += 1
+                    elif child_kind == __COMPOUND_STMT__:
+                        body_nodes.append(child)
+
+            for child in body_nodes:
+                body_ctx = NodeCtx(child)
+                length = body_ctx.end_line - body_ctx.start_line
+                if (self.__max_body_size__ > 0) and (length > self.__max_body_size__):
+                    visitor.do_report('CPP-000000', 'too_long_func_body',
+                                      'too long function body: {} lines'.format(length), body_ctx)
+            if (self.__max_param_num__ > 0) and (param_numb > self.__max_param_num__):
+                visitor.do_report('CPP-000001', 'too_many_params_in_func',
+                                  'there are too many parameters in func: {} params found'.format(param_numb),
+                                  ctx)
         return
 
 
-class FuncParamNumLinter(BaseLinter):
-    """FuncParamNumLinter implements the linter for checking the number of parameters.
+class FuncBodySizeLinter(FunctionDeclCompositeLinter):
+    """FuncBodySizeLinter implements the linter for checking the size of function body.
     """
+    __slots__ = ()
 
-    def __init__(self, max_param_num: int):
-        self.__max_param_num__ = max_param_num
+    def __init__(self, max_body_size: int):
+        super().__init__(max_body_size, 0)
         return
 
-    def check(self, visitor: AstVisitor, node: clang.cindex.Cursor):
-        if (visitor is None) or (node is None):
-            return
-        parent_kind = '{}'.format(node.kind)
-        if parent_kind.endswith('CXX_METHOD') or parent_kind.endswith('FUNCTION_DECL'):
-            param_numb = 0
-            for child in node.get_children():
-                if child is None:
-                    continue
-                child: clang.cindex.Cursor
-                child_kind = '{}'.format(child.kind)
-                if child_kind.endswith('PARM_DECL'):
-                    param_numb += 1
-            if (self.__max_param_num__ > 0) and (param_numb > self.__max_param_num__):
-                visitor.do_report('CPP-000001', 'too_many_params_in_func',
-                                  'there are too many parameters in func: {} params found'.format(param_numb),
-                                  node)
+
+class FuncParamNumLinter(FunctionDeclCompositeLinter):
+    """FuncParamNumLinter implements the linter for checking the number of parameters.
+    """
+    __slots__ = ()
+
+    def __init__(self, max_param_num: int):
+        super().__init__(0, max_param_num)
         return
 
 
 class MagicNumbUseLinter(BaseLinter):
     """MagicNumbUseLinter implements the linter to check the invalid usage of magic numbers.
     """
+    __slots__ = ('__ignore_numbers__',)
+    REQUIRES_PARENT_STACK = True  # the parent of literal is checked
 
     def __init__(self, ignore_numbers: list):
-        self.__ignore_numbers__ = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096]
+        ignores = {16, 32, 64, 128, 256, 512, 1024, 2048, 4096}
         for ignore_number in ignore_numbers:
             if isinstance(ignore_number, int):
-                self.__ignore_numbers__.append(ignore_number)
+                ignores.add(ignore_number)
             if isinstance(ignore_number, float):
-                self.__ignore_numbers__.append(ignore_number)
+                ignores.add(ignore_number)
+        # the negatives are mirrored in advance to check the membership once
+        self.__ignore_numbers__ = frozenset(ignores) | frozenset(-value for value in ignores)
         return
 
+    def target_kinds(self):
+        return __LITERAL_KINDS__
+
     def __is_ignore_magic__(self, value):
-        if isinstance(value, int):
-            if (value < 10) and (value > -10):
-                return True
-            if value in self.__ignore_numbers__:
-                return True
-            if -value in self.__ignore_numbers__:
-                return True
-            if value % 10 == 0:
-                return True
-            if value % 1024 == 0:
-                return True
-            return False
-        if isinstance(value, float):
-            if (value < 10) and (value > -10):
+        if isinstance(value, (int, float)):
+            if -10 < value < 10:
                 return True
             if value in self.__ignore_numbers__:
                 return True
-            if -value in self.__ignore_numbers__:
-                return True
+            if isinstance(value, int):
+                if value % 10 == 0:
+                    return True
+                if (value & 1023) == 0:  # i.e., value % 1024 == 0
+                    return True
             return False
         return True
 
-    def check(self, visitor: AstVisitor, node: clang.cindex.Cursor):
-        if (visitor is None) or (node is None):
-            return
-        beg_pos = node.extent.start
-        end_pos = node.extent.end
-        beg_pos: clang.cindex.SourceLocation
-        end_pos: clang.cindex.SourceLocation
+    @staticmethod
+    def __literal_value__(node_kind: clang.cindex.CursorKind, spelling: str):
+        """
+        :param node_kind: the kind of literal node, INTEGER_LITERAL or FLOATING_LITERAL
+        :param spelling:  the spelling of token of the literal, e.g., 0x1Fu, 1'000 or 1.5f
+        :return:          the value of the literal, or None if it cannot be parsed
+        """
+        text = spelling.replace("'", '')  # digit separators of C++14
         try:
-            code = visitor.__reader__.code_of_file(beg_pos.file.name)
-        except UnicodeDecodeError:
+            if node_kind == __INTEGER_LITERAL__:
+                text = text.rstrip('uUlLzZ')
+                if (len(text) > 1) and (text[0] == '0') and text[1].isdigit():
+                    return int(text, 8)  # octal literal of C, e.g., 017
+                return int(text, 0)
+            elif node_kind == __FLOATING_LITERAL__:
+                text = text.rstrip('fFlL')
+                if text[:2] in ('0x', '0X'):
+                    return float.fromhex(text)
+                return float(text)
+        except ValueError:
+            pass  # e.g., the user-defined literals
+        return None
+
+    def check(self, visitor: AstVisitor, ctx: NodeCtx):
+        if (visitor is None) or (ctx is None):
             return
-
-        node_kind = '{}'.format(node.kind)
-        value = None
-        if node_kind.endswith('INTEGER_LITERAL'):
-            sub_code = code[beg_pos.offset: end_pos.offset]
-            try:
-                value = int(sub_code)
-            except ValueError:
-                return
-            if self.__is_ignore_magic__(value):
-                return
-        elif node_kind.endswith('FLOATING_LITERAL'):
-            sub_code = code[beg_pos.offset: end_pos.offset]
-            try:
-                value = float(sub_code)
-            except ValueError:
-                return
-            if self.__is_ignore_magic__(value):
-                return
-        if value is None:
+        token = next(ctx.cursor.get_tokens(), None)  # the literal is tokenized by libclang
+        if (token is None) or (token.kind != clang.cindex.TokenKind.LITERAL):
+            return
+        if token.extent.start.offset != ctx.start_off:
+            return  # the literal is expanded from macro defined elsewhere
+        value = MagicNumbUseLinter.__literal_value__(ctx.kind, token.spelling)
+        if (value is None) or self.__is_ignore_magic__(value):
             return
 
         parent = visitor.__c_stack__[-1]
         parent: clang.cindex.Cursor
-        parent_kind = '{}'.format(parent.kind)
-        if not parent_kind.endswith('VAR_DECL'):  # TODO: add more context-based ignorance
+        if parent.kind != __VAR_DECL__:  # TODO: add more context-based ignorance
             visitor.do_report('CPP-000003', 'magic_number_usage',
-                              'magic number {} should not be used'.format(value), node)
+                              'magic number {} should not be used'.format(value), ctx)
         return
 
 
+__worker_visitor__ = None  # the visitor owned by each worker process checking files
+__worker_linters__ = None  # the linters performed by each worker process
+
+
+def __init_worker__(lib_path: str, linters: list):
+    """This method initializes the worker process with its own visitor and linters.
+
+    :param lib_path: the path of directory of the libclang library files
+    :param linters:  the list of static code linters, which are pickled to the worker
+    :return:
+    """
+    global __worker_visitor__, __worker_linters__
+    ccode.set_clang_libpath(lib_path)
+    __worker_visitor__ = AstVisitor()  # translation units cannot be shared among processes
+    __worker_linters__ = linters
+    return
+
+
+def __dump_reports__(reports: list):
+    """
+    :param reports: the list of reports found by linters in a source file
+    :return:        the bytes of reports encoded as JSON lines
+    """
+    if orjson is not None:
+        option = orjson.OPT_APPEND_NEWLINE
+        return b''.join(orjson.dumps(report.to_dict(), option=option) for report in reports)
+    return ''.join(json.dumps(report.to_dict(), separators=(',', ':')) + '\n'
+                   for report in reports).encode('utf-8')
+
+
+def __lint_in_worker__(c_file: str):
+    """This method performs the linters of worker process on the given C++ source file.
+
+    :param c_file: the path of source file being checked for its errors
+    :return:       the path of file, the number of its reports and their bytes as JSON lines,
+                   which are encoded in the worker to only pass bytes back to the parent
+    """
+    try:
+        reports = __worker_visitor__.do_file_check(c_file, __worker_linters__)
+        if not reports:
+            return c_file, 0, b''
+        return c_file, len(reports), __dump_reports__(reports)
+    except InterruptedError:
+        return c_file, 0, b''
+    except UnicodeDecodeError as e:
+        logging.error('\tdecode-err: {}'.format(e))
+        return c_file, 0, b''
+    finally:
+        # release the AST and code of the file soon to keep memory flat
+        __worker_visitor__.__reader__.release_file(c_file)
+
+
 if __name__ == '__main__':
     # initialize the AST visitor
     ccode.set_clang_libpath('/opt/homebrew/opt/llvm/lib')
@@ -314,10 +588,9 @@ if __name__ == '__main__':
 
     lint_visitor = AstVisitor()
     all_linters = [
-        FuncBodySizeLinter(16),
-        FuncParamNumLinter(4),
+        FunctionDeclCompositeLinter(16, 4),
         MagicNumbUseLinter([])
     ]
     lint_visitor.do_all_checks(root_dir, all_linters,
-                               os.path.join(out_dir, 'issues.json'))
+                               os.path.join(out_dir, 'issues.jsonl'))
 